@@ -1,13 +1,20 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from pydantic import BaseModel, TypeAdapter
 from typing import List, Optional
 import os
+import time
 from datetime import datetime
 import uuid
-import json
+import html
+from string import Template
+import orjson
+import xxhash
+import brotli
 import asyncio
+import random
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -15,13 +22,21 @@ load_dotenv()
 
 app = FastAPI(title="Live UI Gemini API", description="AI-powered UI generation with Gemini", version="1.0.0")
 
-# Configure CORS - Allow all origins for flexibility
+# Configure CORS - only local dev origins and hosted Railway/Vercel/Netlify frontends are
+# allowed. Frontends on any other origin (e.g. a custom domain) must be added via the
+# comma-separated CORS_ALLOW_ORIGINS environment variable.
+CORS_ALLOW_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000"] + [
+    origin.strip() for origin in os.getenv("CORS_ALLOW_ORIGINS", "").split(",") if origin.strip()
+]
+CORS_ALLOW_ORIGIN_REGEX = r"https://([a-z0-9-]+\.)*(railway|vercel|netlify)\.app"
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins for now
-    allow_credentials=False,  # Set to False when using allow_origins=["*"]
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=CORS_ALLOW_ORIGINS,
+    allow_origin_regex=CORS_ALLOW_ORIGIN_REGEX,
+    allow_credentials=False,
+    allow_methods=["GET", "POST", "DELETE"],
+    allow_headers=["content-type", "authorization"],
 )
 
 # Initialize Gemini client
@@ -58,6 +73,19 @@ else:
 
 MODEL_ID = "gemini-2.5-flash-lite-preview-06-17"
 
+# Prefix the model puts before the generated HTML document
+HTML_MARKER = "HTML_PAGE:"
+
+# Bound concurrent Gemini calls so bursts queue up instead of failing with 429s.
+# GEMINI_MAX_CONCURRENT is the limit for the whole server, so each worker process
+# gets an equal share of it (run.py exports the worker count as WEB_CONCURRENCY).
+GEMINI_MAX_CONCURRENT = int(os.getenv("GEMINI_MAX_CONCURRENT", "8"))
+WORKER_COUNT = int(os.getenv("WEB_CONCURRENCY", "1"))
+GEMINI_MAX_CONCURRENT_PER_WORKER = max(1, GEMINI_MAX_CONCURRENT // WORKER_COUNT)
+GEMINI_MAX_RETRIES = 3
+GEMINI_RETRY_BASE_DELAY = 1.0  # seconds
+LLM_SEMAPHORE = asyncio.Semaphore(GEMINI_MAX_CONCURRENT_PER_WORKER)
+
 # System instruction for dynamic UI generation with grounding
 UI_SYSTEM_INSTRUCTION = """
 CRITICAL: You are ONLY allowed to respond with HTML interfaces. Plain text responses are FORBIDDEN.
@@ -95,200 +123,32 @@ DESIGN STANDARDS:
 REMEMBER: NO PLAIN TEXT RESPONSES EVER. Every response MUST be "HTML_PAGE:" followed by complete HTML.
 """
 
-# Pydantic models
-class Message(BaseModel):
-    id: str
-    role: str  # 'user' or 'assistant'
-    content: str
-    timestamp: datetime
-    is_generated_ui: Optional[bool] = False
-
-class ChatRequest(BaseModel):
-    message: str
-    conversation_id: Optional[str] = None
-    history: Optional[List[Message]] = []
-
-class ChatResponse(BaseModel):
-    response: str
-    conversation_id: str
-    is_ui: bool
-    html_content: Optional[str] = None
-    history: List[Message]
-
-# In-memory storage for conversations (use database in production)
-conversations = {}
-
-def safe_json_encode(data):
-    """Safely encode data to JSON, handling problematic content"""
-    try:
-        return json.dumps(data, ensure_ascii=False)
-    except Exception as e:
-        print(f"JSON encoding error: {e}")
-        # Create a safe fallback
-        safe_data = {
-            "type": data.get("type", "error"),
-            "content": "Content encoding error",
-            "conversation_id": data.get("conversation_id", ""),
-            "is_complete": data.get("is_complete", False)
-        }
-        return json.dumps(safe_data, ensure_ascii=False)
-
-@app.get("/")
-async def root():
-    return {"message": "Live UI Gemini API with Grounding is running!", "model": MODEL_ID}
+# Grounding tools and generation config are immutable, so build them once at import
+GROUNDING_TOOLS = [types.Tool(google_search=types.GoogleSearch())]
 
-@app.get("/api/cors-test")
-async def cors_test(request: Request):
-    """Test endpoint to debug CORS issues"""
-    origin = request.headers.get("origin", "No origin header")
-    return {
-        "message": "CORS test successful",
-        "origin": origin,
-        "headers": dict(request.headers)
-    }
+GEN_CONFIG = types.GenerateContentConfig(
+    system_instruction=UI_SYSTEM_INSTRUCTION,
+    temperature=0.7,
+    top_p=0.95,
+    top_k=20,
+    tools=GROUNDING_TOOLS
+)
 
-@app.post("/api/chat/stream")
-async def chat_stream(request: ChatRequest):
-    """Streaming chat endpoint for real-time UI generation with grounding"""
-    
-    # Check if Gemini client is available
-    if not client:
-        async def error_stream():
-            error_data = {
-                "type": "complete",
-                "final_text": "Error: GOOGLE_API_KEY environment variable is not set. Please configure it in Railway.",
-                "html_content": None,
-                "is_ui": False,
-                "conversation_id": str(uuid.uuid4()),
-                "is_complete": True
-            }
-            yield f"data: {safe_json_encode(error_data)}\n\n"
-        
-        return StreamingResponse(
-            error_stream(),
-            media_type="text/plain",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/event-stream",
-            }
-        )
-    
-    try:
-        # Generate or use existing conversation ID
-        conversation_id = request.conversation_id or str(uuid.uuid4())
-        
-        # Get conversation history
-        conversation_history = conversations.get(conversation_id, [])
-        if request.history:
-            conversation_history = [msg.dict() for msg in request.history]
-        
-        async def generate_stream():
-            accumulated_text = ""
-            is_ui_response = True  # Always generate UI
-            
-            try:
-                # Prepare conversation history for Gemini
-                contents = []
-                
-                # Add conversation history
-                for msg in conversation_history:
-                    contents.append(types.Content(
-                        role='user' if msg['role'] == 'user' else 'model',
-                        parts=[types.Part(text=msg['content'])]
-                    ))
-                
-                # Add current message
-                contents.append(types.Content(
-                    role='user',
-                    parts=[types.Part(text=request.message)]
-                ))
-                
-                # Create config with grounding tools
-                tools = []
-                # Add Google Search grounding
-                tools.append(types.Tool(google_search=types.GoogleSearch()))
-                
-                config = types.GenerateContentConfig(
-                    system_instruction=UI_SYSTEM_INSTRUCTION,
-                    temperature=0.7,
-                    top_p=0.95,
-                    top_k=20,
-                    tools=tools
-                )
-                
-                # Use non-streaming approach to avoid JSON parsing issues
-                response = client.models.generate_content(
-                    model=MODEL_ID,
-                    contents=contents,
-                    config=config
-                )
-                
-                response_text = response.text if response.text else ""
-                
-                # Fast streaming by sending character chunks
-                chunk_size = 25  # Characters per chunk
-                for i in range(0, len(response_text), chunk_size):
-                    chunk_text = response_text[i:i + chunk_size]
-                    accumulated_text += chunk_text
-                    
-                    # Check if this is a UI generation response
-                    if "HTML_PAGE:" in accumulated_text and not is_ui_response:
-                        is_ui_response = True
-                    
-                    # If it's a UI response, send HTML content directly as we get it
-                    if is_ui_response and "HTML_PAGE:" in accumulated_text:
-                        html_match = accumulated_text.split("HTML_PAGE:", 1)
-                        if len(html_match) > 1:
-                            accumulated_html = html_match[1].strip()
-                            
-                            # Send HTML chunk if we have substantial content
-                            if len(accumulated_html) > 150 and accumulated_html.count('<') > 5:
-                                html_chunk_data = {
-                                    "type": "html_chunk",
-                                    "html_content": accumulated_html,
-                                    "conversation_id": conversation_id,
-                                    "is_complete": False
-                                }
-                                yield f"data: {safe_json_encode(html_chunk_data)}\n\n"
-                    
-                    # Send text chunk
-                    chunk_data = {
-                        "type": "text_chunk",
-                        "content": chunk_text,
-                        "accumulated_text": accumulated_text,
-                        "conversation_id": conversation_id,
-                        "is_complete": False
-                    }
-                    
-                    yield f"data: {safe_json_encode(chunk_data)}\n\n"
-                    await asyncio.sleep(0.01)  # Fast streaming
-                
-                # Send final completion
-                final_html = None
-                clean_text = "I've generated a dynamic UI for you!"
-                
-                if "HTML_PAGE:" in accumulated_text:
-                    # Extract HTML content if properly formatted
-                    html_match = accumulated_text.split("HTML_PAGE:", 1)
-                    if len(html_match) > 1:
-                        final_html = html_match[1].strip()
-                else:
-                    # Force HTML generation if model didn't follow instructions
-                    final_html = f"""<!DOCTYPE html>
+# Fallback page used when the model doesn't follow the HTML_PAGE: format (compiled once at import)
+FALLBACK_HTML = Template("""<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Dynamic Response</title>
     <style>
-        * {{
+        * {
             margin: 0;
             padding: 0;
             box-sizing: border-box;
-        }}
+        }
         
-        body {{
+        body {
             font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             min-height: 100vh;
@@ -296,31 +156,31 @@ async def chat_stream(request: ChatRequest):
             display: flex;
             align-items: center;
             justify-content: center;
-        }}
+        }
         
-        .container {{
+        .container {
             background: white;
             border-radius: 15px;
             box-shadow: 0 20px 60px rgba(0, 0, 0, 0.1);
             padding: 2rem;
             max-width: 800px;
             width: 100%;
-        }}
+        }
         
-        .header {{
+        .header {
             text-align: center;
             margin-bottom: 2rem;
             padding-bottom: 1rem;
             border-bottom: 2px solid #f8f9fa;
-        }}
+        }
         
-        .header h1 {{
+        .header h1 {
             color: #333;
             font-size: 2rem;
             margin-bottom: 0.5rem;
-        }}
+        }
         
-        .content {{
+        .content {
             background: #f8f9fa;
             padding: 1.5rem;
             border-radius: 10px;
@@ -328,18 +188,18 @@ async def chat_stream(request: ChatRequest):
             line-height: 1.6;
             color: #333;
             white-space: pre-wrap;
-        }}
+        }
         
-        .footer {{
+        .footer {
             text-align: center;
             margin-top: 2rem;
             padding-top: 1rem;
             border-top: 1px solid #e9ecef;
             color: #6c757d;
             font-size: 0.9rem;
-        }}
+        }
         
-        .timestamp {{
+        .timestamp {
             background: #667eea;
             color: white;
             padding: 0.25rem 0.75rem;
@@ -347,7 +207,7 @@ async def chat_stream(request: ChatRequest):
             font-size: 0.8rem;
             display: inline-block;
             margin-top: 1rem;
-        }}
+        }
     </style>
 </head>
 <body>
@@ -357,73 +217,613 @@ async def chat_stream(request: ChatRequest):
         </div>
         
         <div class="content">
-{accumulated_text}
+$text
         </div>
         
         <div class="footer">
-            <div class="timestamp">Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</div>
+            <div class="timestamp">Generated: $ts</div>
         </div>
     </div>
 </body>
-</html>"""
-                
-                completion_data = {
-                    "type": "complete",
-                    "final_text": clean_text,
-                    "html_content": final_html,
-                    "is_ui": True,  # Always UI
-                    "conversation_id": conversation_id,
-                    "is_complete": True
-                }
-                yield f"data: {safe_json_encode(completion_data)}\n\n"
-                
+</html>""")
+
+# Formatted timestamp cached at one-second granularity
+_timestamp_cache = {"second": None, "value": ""}
+
+def current_timestamp_str():
+    """Get the current time as 'YYYY-MM-DD HH:MM:SS', formatting at most once per second"""
+    second = int(time.time())
+    if _timestamp_cache["second"] != second:
+        _timestamp_cache["second"] = second
+        _timestamp_cache["value"] = datetime.fromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S')
+    return _timestamp_cache["value"]
+
+def render_fallback_html(text):
+    """Wrap a plain-text model response in the fallback HTML page"""
+    return FALLBACK_HTML.substitute(
+        text=html.escape(text),
+        ts=current_timestamp_str()
+    )
+
+# Pydantic models
+class Message(BaseModel):
+    id: str
+    role: str  # 'user' or 'assistant'
+    content: str
+    timestamp: datetime
+    is_generated_ui: Optional[bool] = False
+
+class ChatRequest(BaseModel):
+    message: str
+    conversation_id: Optional[str] = None
+    history: Optional[List[Message]] = []
+
+class ChatResponse(BaseModel):
+    response: str
+    conversation_id: str
+    is_ui: bool
+    html_content: Optional[str] = None
+    html_id: Optional[str] = None
+    history: List[Message]
+
+# Compiled once and reused for converting message histories to and from plain dicts
+MSG_LIST_ADAPTER = TypeAdapter(List[Message])
+
+CONVERSATION_TTL_SECONDS = 24 * 3600
+HTML_TTL_SECONDS = 3600
+HTML_BROTLI_QUALITY = 4
+
+# In-process storage for conversations and generated HTML, bounded in size and age so a
+# long-running server can't grow without limit. When REDIS_URL is set these act as a hot
+# layer in front of Redis, which is shared across workers and survives restarts.
+conversations = TTLCache(maxsize=10_000, ttl=CONVERSATION_TTL_SECONDS)
+html_storage = TTLCache(maxsize=5_000, ttl=HTML_TTL_SECONDS)
+
+# Exact-match cache of Gemini responses, so repeated prompts skip the LLM round-trip
+RESPONSE_CACHE_TTL_SECONDS = 3600
+response_cache = TTLCache(maxsize=1_000, ttl=RESPONSE_CACHE_TTL_SECONDS)
+CACHE_REPLAY_CHUNK_SIZE = 256
+
+# cachetools' get() and pop() check `key in cache` before reading, and a TTLCache entry can
+# expire in between and raise KeyError, so read and delete entries with a single operation
+def cache_get(cache, key):
+    """Get an entry from a TTLCache, or None if it is missing or expired"""
+    try:
+        return cache[key]
+    except KeyError:
+        return None
+
+def cache_discard(cache, key):
+    """Remove an entry from a TTLCache if it is present"""
+    try:
+        del cache[key]
+    except KeyError:
+        pass
+
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_TIMEOUT_SECONDS = 1.0
+# After a connection failure, skip Redis for this long instead of paying the timeout on every call
+REDIS_RETRY_AFTER_SECONDS = 30
+REDIS_CONNECTION_ERRORS = (OSError, asyncio.TimeoutError)
+_redis_state = {"down_until": 0.0}
+redis_client = None
+if REDIS_URL:
+    import redis.asyncio as aioredis
+    from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+    REDIS_CONNECTION_ERRORS += (RedisConnectionError, RedisTimeoutError)
+    # Short timeouts so an unreachable Redis falls back to process memory instead of stalling requests
+    redis_client = aioredis.from_url(
+        REDIS_URL,
+        socket_connect_timeout=REDIS_TIMEOUT_SECONDS,
+        socket_timeout=REDIS_TIMEOUT_SECONDS
+    )
+else:
+    print("WARNING: REDIS_URL not found. Conversations and HTML will be kept in process memory only.")
+
+def redis_available():
+    """Check whether Redis is configured and not being skipped after a connection failure"""
+    return redis_client is not None and time.monotonic() >= _redis_state["down_until"]
+
+def redis_failed(action, error):
+    """Log a Redis error, and skip Redis for a while if the server looks unreachable"""
+    print(f"Redis error {action}: {error}")
+    if isinstance(error, REDIS_CONNECTION_ERRORS):
+        _redis_state["down_until"] = time.monotonic() + REDIS_RETRY_AFTER_SECONDS
+
+async def load_conversation(conversation_id):
+    """Get conversation history by ID, or None if it does not exist"""
+    if redis_available():
+        try:
+            raw = await redis_client.get(f"conv:{conversation_id}")
+        except Exception as e:
+            redis_failed("loading conversation", e)
+            # Redis is unavailable, so fall back to the copy kept in process memory
+            return cache_get(conversations, conversation_id)
+        if raw is None:
+            # Redis is authoritative: the conversation was deleted or expired, possibly by
+            # another worker, so don't resurrect a stale local copy
+            cache_discard(conversations, conversation_id)
+            return None
+        return orjson.loads(raw)
+    return cache_get(conversations, conversation_id)
+
+async def save_conversation(conversation_id, history):
+    """Store conversation history in the hot layer and Redis"""
+    conversations[conversation_id] = history
+    if redis_available():
+        try:
+            await redis_client.set(f"conv:{conversation_id}", orjson.dumps(history), ex=CONVERSATION_TTL_SECONDS)
+        except Exception as e:
+            redis_failed("saving conversation", e)
+
+async def remove_conversation(conversation_id):
+    """Delete conversation history from the hot layer and Redis"""
+    cache_discard(conversations, conversation_id)
+    if redis_available():
+        try:
+            await redis_client.delete(f"conv:{conversation_id}")
+        except Exception as e:
+            redis_failed("deleting conversation", e)
+
+async def load_html_blob(html_id):
+    """Get stored Brotli-compressed HTML by ID, or None if it does not exist"""
+    blob = cache_get(html_storage, html_id)
+    if blob is not None:
+        return blob
+    if redis_available():
+        try:
+            blob = await redis_client.get(f"html:{html_id}")
+            if blob is not None:
+                html_storage[html_id] = blob
+                return blob
+        except Exception as e:
+            redis_failed("loading HTML", e)
+    return None
+
+async def load_html(html_id):
+    """Get stored HTML content by ID, or None if it does not exist"""
+    blob = await load_html_blob(html_id)
+    if blob is None:
+        return None
+    return brotli.decompress(blob).decode()
+
+async def store_html(html_content):
+    """Store HTML content under its content hash and return the ID"""
+    # Content-addressed, so identical pages generated twice are stored (and fetched) once.
+    # xxh3 is a fast non-cryptographic hash, which is all a storage key needs.
+    html_bytes = html_content.encode()
+    html_id = xxhash.xxh3_64_hexdigest(html_bytes)
+    # Generated HTML compresses very well, so keep it Brotli-compressed at rest
+    blob = cache_get(html_storage, html_id)
+    if blob is None:
+        blob = brotli.compress(html_bytes, quality=HTML_BROTLI_QUALITY)
+    
+    # Always re-insert and rewrite with a fresh TTL, so an ID just sent to a client
+    # can't expire early because an identical page was stored a while ago
+    html_storage[html_id] = blob
+    if redis_available():
+        try:
+            await redis_client.set(f"html:{html_id}", blob, ex=HTML_TTL_SECONDS)
+        except Exception as e:
+            redis_failed("saving HTML", e)
+    return html_id
+
+def llm_cache_key(conversation_history, message):
+    """Hash the conversation and new message into a response cache key"""
+    turns = orjson.dumps([[msg['role'], msg['content']] for msg in conversation_history])
+    return xxhash.xxh3_64_hexdigest(turns + message.encode())
+
+async def load_cached_response(cache_key):
+    """Get a cached Gemini response text, or None on a cache miss"""
+    if redis_available():
+        try:
+            cached = await redis_client.get(f"llm:{cache_key}")
+            if cached is not None:
+                return cached.decode()
+        except Exception as e:
+            redis_failed("loading cached response", e)
+    return cache_get(response_cache, cache_key)
+
+async def save_cached_response(cache_key, response_text):
+    """Cache a Gemini response text in the hot layer and Redis"""
+    response_cache[cache_key] = response_text
+    if redis_available():
+        try:
+            await redis_client.set(f"llm:{cache_key}", response_text, ex=RESPONSE_CACHE_TTL_SECONDS)
+        except Exception as e:
+            redis_failed("caching response", e)
+
+# Only the most recent turns are sent verbatim to Gemini; older ones are folded into a summary
+HISTORY_WINDOW_TURNS = 6
+HISTORY_MESSAGE_MAX_CHARS = 2000
+SUMMARY_PROMPT_MAX_CHARS = 80
+
+def shorten_for_summary(text):
+    """Collapse whitespace and cap the length of a message quoted in a history summary"""
+    text = " ".join(text.split())
+    if len(text) > SUMMARY_PROMPT_MAX_CHARS:
+        text = text[:SUMMARY_PROMPT_MAX_CHARS] + "..."
+    return text
+
+def summarize_history(messages):
+    """Build a one-line summary of older conversation turns from the user's prompts"""
+    prompts = [shorten_for_summary(msg['content']) for msg in messages if msg['role'] == 'user']
+    if prompts:
+        return "Summary of earlier conversation - the user previously asked for: " + "; ".join(prompts)
+    # Only assistant messages (e.g. an opening greeting), so summarize those instead of dropping them
+    replies = [shorten_for_summary(msg['content']) for msg in messages]
+    if replies:
+        return "Summary of earlier conversation - the assistant previously said: " + "; ".join(replies)
+    return None
+
+def build_gemini_history(conversation_history):
+    """Convert our message history to Gemini's format, keeping only a recent window verbatim"""
+    window_size = HISTORY_WINDOW_TURNS * 2
+    older = conversation_history[:-window_size] if len(conversation_history) > window_size else []
+    recent = conversation_history[len(older):]
+    
+    # Start the window on a user message, so the history opens with a user turn
+    while recent and recent[0]['role'] != 'user':
+        older.append(recent[0])
+        recent = recent[1:]
+    
+    # The summary goes into that first user message rather than a turn of its own, so roles
+    # keep alternating. It only stands alone if no user message is left in the window.
+    summary = summarize_history(older)
+    contents = []
+    if summary and not recent:
+        contents.append(types.Content(
+            role='user',
+            parts=[types.Part(text=summary)]
+        ))
+    
+    for msg in recent:
+        # Guard against full HTML documents sent back in client-supplied history
+        content = msg['content']
+        if len(content) > HISTORY_MESSAGE_MAX_CHARS:
+            content = content[:HISTORY_MESSAGE_MAX_CHARS]
+        if summary and not contents:
+            content = f"{summary}\n\n{content}"
+        contents.append(types.Content(
+            role='user' if msg['role'] == 'user' else 'model',
+            parts=[types.Part(text=content)]
+        ))
+    return contents
+
+def is_rate_limited(error):
+    """Check whether a Gemini error is a 429 / RESOURCE_EXHAUSTED response"""
+    return getattr(error, "code", None) == 429
+
+async def rate_limit_backoff(attempt):
+    """Sleep for a randomized, exponentially growing delay before retrying"""
+    await asyncio.sleep(random.uniform(0, GEMINI_RETRY_BASE_DELAY * (2 ** attempt)))
+
+async def stream_gemini_content(contents, config):
+    """Stream Gemini chunks, retrying rate-limited requests before any output is produced"""
+    async with LLM_SEMAPHORE:
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            started = False
+            try:
+                stream = await client.aio.models.generate_content_stream(
+                    model=MODEL_ID,
+                    contents=contents,
+                    config=config
+                )
+                async for chunk in stream:
+                    started = True
+                    yield chunk
+                return
             except Exception as e:
-                print(f"Error in generate_stream: {e}")
-                # Send error message
-                error_data = {
-                    "type": "complete",
-                    "final_text": f"Sorry, I encountered an error: {str(e)}. Please try again.",
-                    "html_content": None,
-                    "is_ui": False,
-                    "conversation_id": conversation_id,
-                    "is_complete": True
-                }
-                yield f"data: {safe_json_encode(error_data)}\n\n"
-                accumulated_text = error_data["final_text"]
-                is_ui_response = False
+                if started or not is_rate_limited(e) or attempt == GEMINI_MAX_RETRIES:
+                    raise
+                print(f"Gemini rate limited, retrying (attempt {attempt + 1}/{GEMINI_MAX_RETRIES})")
+                await rate_limit_backoff(attempt)
+
+def is_grounded(chunk):
+    """Check whether a streamed chunk carries Google Search grounding results"""
+    for candidate in chunk.candidates or []:
+        metadata = candidate.grounding_metadata
+        if metadata and (metadata.web_search_queries or metadata.grounding_chunks):
+            return True
+    return False
+
+async def response_chunks(cached_text, contents, config):
+    """Yield (text, grounded) pairs, replaying a cached response or streaming from Gemini"""
+    if cached_text is not None:
+        for i in range(0, len(cached_text), CACHE_REPLAY_CHUNK_SIZE):
+            yield cached_text[i:i + CACHE_REPLAY_CHUNK_SIZE], False
+        return
+    async for chunk in stream_gemini_content(contents, config):
+        yield chunk.text or "", is_grounded(chunk)
+
+async def send_chat_message(chat, message):
+    """Send a chat message to Gemini, retrying rate-limited requests"""
+    async with LLM_SEMAPHORE:
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            try:
+                return await chat.send_message(message)
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == GEMINI_MAX_RETRIES:
+                    raise
+                print(f"Gemini rate limited, retrying (attempt {attempt + 1}/{GEMINI_MAX_RETRIES})")
+                await rate_limit_backoff(attempt)
+
+# Pre-built SSE framing so frames can be yielded as bytes without an extra encode step
+SSE_DATA_PREFIX = b"data: "
+SSE_FRAME_SUFFIX = b"\n\n"
+SSE_KEEPALIVE_FRAME = b": ping\n\n"
+SSE_KEEPALIVE_SECONDS = 15
+
+def safe_json_bytes(data):
+    """Safely encode data to UTF-8 JSON bytes, handling problematic content"""
+    try:
+        return orjson.dumps(data)
+    except Exception as e:
+        print(f"JSON encoding error: {e}")
+        # Create a safe fallback
+        safe_data = {
+            "type": data.get("type", "error"),
+            "content": "Content encoding error",
+            "conversation_id": data.get("conversation_id", ""),
+            "is_complete": data.get("is_complete", False)
+        }
+        return orjson.dumps(safe_data)
+
+def normalize_newlines(text):
+    """Convert CR and CRLF line endings to LF, the only separator SSE data lines keep"""
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+def html_delta_frame(html_delta):
+    """Frame an HTML delta as a named SSE event with raw HTML data lines, skipping JSON"""
+    lines = normalize_newlines(html_delta).split("\n")
+    return ("event: html_delta\n" + "".join(f"data: {line}\n" for line in lines) + "\n").encode()
+
+async def with_keepalive(frames):
+    """Interleave SSE comment pings while waiting on frames so proxies don't drop idle streams"""
+    iterator = frames.__aiter__()
+    pending = asyncio.ensure_future(iterator.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({pending}, timeout=SSE_KEEPALIVE_SECONDS)
+            if not done:
+                yield SSE_KEEPALIVE_FRAME
+                continue
+            try:
+                frame = pending.result()
+            except StopAsyncIteration:
+                return
+            yield frame
+            pending = asyncio.ensure_future(iterator.__anext__())
+    finally:
+        pending.cancel()
+
+@app.get("/")
+async def root():
+    return {"message": "Live UI Gemini API with Grounding is running!", "model": MODEL_ID}
+
+@app.get("/api/cors-test")
+async def cors_test(request: Request):
+    """Test endpoint to debug CORS issues"""
+    origin = request.headers.get("origin", "No origin header")
+    return {
+        "message": "CORS test successful",
+        "origin": origin,
+        "headers": dict(request.headers)
+    }
+
+def marker_prefix_len(text):
+    """Length of the longest ending of text that is a proper prefix of HTML_MARKER"""
+    for size in range(min(len(text), len(HTML_MARKER) - 1), 0, -1):
+        if HTML_MARKER.startswith(text[-size:]):
+            return size
+    return 0
+
+async def chat_events(request: ChatRequest):
+    """Yield chat stream event payloads for real-time UI generation with grounding"""
+    
+    # Check if Gemini client is available
+    if not client:
+        yield {
+            "type": "complete",
+            "final_text": "Error: GOOGLE_API_KEY environment variable is not set. Please configure it in Railway.",
+            "html_id": None,
+            "is_ui": False,
+            "conversation_id": str(uuid.uuid4()),
+            "is_complete": True
+        }
+        return
+    
+    # Generate or use existing conversation ID
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    
+    # Get conversation history
+    conversation_history = await load_conversation(conversation_id) or []
+    if request.history:
+        conversation_history = MSG_LIST_ADAPTER.dump_python(request.history, mode="json")
+    
+    accumulated_text = ""
+    is_ui_response = True  # Always generate UI
+    
+    try:
+        # Prepare conversation history for Gemini
+        contents = build_gemini_history(conversation_history)
+        
+        # Add current message
+        contents.append(types.Content(
+            role='user',
+            parts=[types.Part(text=request.message)]
+        ))
+        
+        # Stream the response from Gemini as chunks arrive. Text is collected in lists and
+        # joined once at the end rather than re-concatenated on every chunk.
+        text_parts = []
+        html_parts = []  # Text following the HTML_PAGE: marker, without leading whitespace
+        html_parts_sent = 0
+        html_len = 0
+        html_tag_count = 0
+        seen_html_marker = False
+        marker_tail = ""  # Unsent text that may be the start of a marker split across chunks
+        
+        response_grounded = False
+        
+        # Identical prompts in the same conversation are replayed from the response cache
+        cache_key = llm_cache_key(conversation_history, request.message)
+        cached_text = await load_cached_response(cache_key)
+        
+        async for chunk_text, grounded in response_chunks(cached_text, contents, GEN_CONFIG):
+            response_grounded = response_grounded or grounded
+            if not chunk_text:
+                continue
+            text_parts.append(chunk_text)
             
-            # Update conversation history
-            user_message = Message(
-                id=str(uuid.uuid4()),
-                role="user",
-                content=request.message,
-                timestamp=datetime.now()
-            )
+            # Look for the HTML_PAGE: marker until it is found; after that every chunk is HTML
+            # Only text before the marker goes into text_chunk events; HTML is sent as deltas
+            new_html = ""
+            chat_text = ""
+            if seen_html_marker:
+                new_html = chunk_text
+            else:
+                window = marker_tail + chunk_text
+                marker_idx = window.find(HTML_MARKER)
+                if marker_idx >= 0:
+                    seen_html_marker = True
+                    new_html = window[marker_idx + len(HTML_MARKER):]
+                    chat_text = window[:marker_idx]
+                    marker_tail = ""
+                else:
+                    # Hold back an ending that could be the start of the marker until the
+                    # next chunk shows whether it is
+                    held = marker_prefix_len(window)
+                    chat_text = window[:len(window) - held]
+                    marker_tail = window[len(window) - held:]
             
-            assistant_message = Message(
-                id=str(uuid.uuid4()),
-                role="assistant",
-                content=clean_text if 'clean_text' in locals() else accumulated_text,
-                timestamp=datetime.now(),
-                is_generated_ui=True  # Always UI
-            )
+            if not html_parts:
+                new_html = new_html.lstrip()
+            if new_html:
+                # Track size and tag count incrementally so each chunk costs O(chunk size)
+                html_parts.append(new_html)
+                html_len += len(new_html)
+                html_tag_count += new_html.count('<')
             
-            new_history = conversation_history + [user_message.dict(), assistant_message.dict()]
-            conversations[conversation_id] = new_history
-        
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/plain",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/event-stream",
+            # If it's a UI response, send only the HTML that is new since the last event.
+            # The first delta waits until we have substantial content.
+            if is_ui_response and len(html_parts) > html_parts_sent and html_len > 150 and html_tag_count > 5:
+                html_delta_data = {
+                    "type": "html_delta",
+                    "html_delta": "".join(html_parts[html_parts_sent:]),
+                    "conversation_id": conversation_id,
+                    "is_complete": False
+                }
+                html_parts_sent = len(html_parts)
+                yield html_delta_data
+                await asyncio.sleep(0)  # Hand control back so each SSE frame is flushed immediately
+            
+            # Send text chunk
+            if chat_text:
+                chunk_data = {
+                    "type": "text_chunk",
+                    "content": chat_text,
+                    "conversation_id": conversation_id,
+                    "is_complete": False
+                }
+                
+                yield chunk_data
+                await asyncio.sleep(0)
+        
+        # The stream ended without a marker, so held-back text was chat text after all
+        if marker_tail and not seen_html_marker:
+            yield {
+                "type": "text_chunk",
+                "content": marker_tail,
+                "conversation_id": conversation_id,
+                "is_complete": False
             }
-        )
+        
+        accumulated_text = "".join(text_parts)
+        
+        # Search-grounded answers depend on current data, so they are not reused
+        if cached_text is None and accumulated_text and not response_grounded:
+            await save_cached_response(cache_key, accumulated_text)
+        
+        # Send final completion
+        final_html = None
+        clean_text = "I've generated a dynamic UI for you!"
+        
+        if seen_html_marker:
+            # Extract HTML content if properly formatted
+            final_html = "".join(html_parts).strip()
+        else:
+            # Force HTML generation if model didn't follow instructions
+            final_html = render_fallback_html(accumulated_text)
+        
+        # Send a reference to the stored HTML instead of inlining the full document
+        html_id = await store_html(final_html) if final_html else None
+        
+        completion_data = {
+            "type": "complete",
+            "final_text": clean_text,
+            "html_id": html_id,
+            "is_ui": True,  # Always UI
+            "conversation_id": conversation_id,
+            "is_complete": True
+        }
+        yield completion_data
+        await asyncio.sleep(0)
         
     except Exception as e:
-        print(f"Error in streaming chat endpoint: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to process streaming message: {str(e)}")
+        print(f"Error in chat_events: {e}")
+        # Send error message
+        error_data = {
+            "type": "complete",
+            "final_text": f"Sorry, I encountered an error: {str(e)}. Please try again.",
+            "html_id": None,
+            "is_ui": False,
+            "conversation_id": conversation_id,
+            "is_complete": True
+        }
+        yield error_data
+        accumulated_text = error_data["final_text"]
+        is_ui_response = False
+    
+    # Update conversation history
+    now = datetime.now()
+    user_message = Message(
+        id=str(uuid.uuid4()),
+        role="user",
+        content=request.message,
+        timestamp=now
+    )
+    
+    assistant_message = Message(
+        id=str(uuid.uuid4()),
+        role="assistant",
+        content=clean_text if 'clean_text' in locals() else accumulated_text,
+        timestamp=now,
+        is_generated_ui=True  # Always UI
+    )
+    
+    new_history = conversation_history + MSG_LIST_ADAPTER.dump_python([user_message, assistant_message], mode="json")
+    await save_conversation(conversation_id, new_history)
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Streaming chat endpoint for real-time UI generation with grounding"""
+    async def generate_stream():
+        async for event in chat_events(request):
+            if event["type"] == "html_delta":
+                yield html_delta_frame(event["html_delta"])
+            else:
+                yield SSE_DATA_PREFIX + safe_json_bytes(event) + SSE_FRAME_SUFFIX
+    
+    return StreamingResponse(
+        with_keepalive(generate_stream()),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+    )
 
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
@@ -432,171 +832,67 @@ async def chat(request: ChatRequest):
         conversation_id = request.conversation_id or str(uuid.uuid4())
         
         # Get conversation history
-        conversation_history = conversations.get(conversation_id, [])
+        conversation_history = await load_conversation(conversation_id) or []
         if request.history:
-            conversation_history = [msg.dict() for msg in request.history]
+            conversation_history = MSG_LIST_ADAPTER.dump_python(request.history, mode="json")
         
         # Convert our message history to Gemini's format
-        gemini_history = []
-        for msg in conversation_history:
-            gemini_history.append(types.Content(
-                role='user' if msg['role'] == 'user' else 'model',
-                parts=[types.Part(text=msg['content'])]
-            ))
-        
-        # Create tools for grounding
-        tools = []
-        tools.append(types.Tool(google_search=types.GoogleSearch()))
-        
-        # Create chat configuration with grounding
-        chat_config = types.GenerateContentConfig(
-            system_instruction=UI_SYSTEM_INSTRUCTION,
-            temperature=0.7,
-            top_p=0.95,
-            top_k=20,
-            tools=tools
-        )
+        gemini_history = build_gemini_history(conversation_history)
         
-        # Create a new chat session with history
-        chat = client.chats.create(
+        # Create a new async chat session with history
+        chat = client.aio.chats.create(
             model=MODEL_ID,
-            config=chat_config,
+            config=GEN_CONFIG,
             history=gemini_history
         )
         
         # Send the new message
-        response = chat.send_message(request.message)
+        response = await send_chat_message(chat, request.message)
         response_text = response.text
         
         # Force UI generation - check if this is properly formatted
         html_content = None
         clean_text = "I've generated a dynamic UI for you!"
         
-        if "HTML_PAGE:" in response_text:
+        if HTML_MARKER in response_text:
             # Extract HTML content if properly formatted
-            html_match = response_text.split("HTML_PAGE:", 1)
+            html_match = response_text.split(HTML_MARKER, 1)
             if len(html_match) > 1:
                 html_content = html_match[1].strip()
         else:
             # Force HTML generation if model didn't follow instructions
-            html_content = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Dynamic Response</title>
-    <style>
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-        
-        body {{
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 20px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-        }}
-        
-        .container {{
-            background: white;
-            border-radius: 15px;
-            box-shadow: 0 20px 60px rgba(0, 0, 0, 0.1);
-            padding: 2rem;
-            max-width: 800px;
-            width: 100%;
-        }}
-        
-        .header {{
-            text-align: center;
-            margin-bottom: 2rem;
-            padding-bottom: 1rem;
-            border-bottom: 2px solid #f8f9fa;
-        }}
-        
-        .header h1 {{
-            color: #333;
-            font-size: 2rem;
-            margin-bottom: 0.5rem;
-        }}
-        
-        .content {{
-            background: #f8f9fa;
-            padding: 1.5rem;
-            border-radius: 10px;
-            border-left: 4px solid #667eea;
-            line-height: 1.6;
-            color: #333;
-            white-space: pre-wrap;
-        }}
+            html_content = render_fallback_html(response_text)
         
-        .footer {{
-            text-align: center;
-            margin-top: 2rem;
-            padding-top: 1rem;
-            border-top: 1px solid #e9ecef;
-            color: #6c757d;
-            font-size: 0.9rem;
-        }}
-        
-        .timestamp {{
-            background: #667eea;
-            color: white;
-            padding: 0.25rem 0.75rem;
-            border-radius: 15px;
-            font-size: 0.8rem;
-            display: inline-block;
-            margin-top: 1rem;
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>🤖 AI Response</h1>
-        </div>
-        
-        <div class="content">
-{response_text}
-        </div>
-        
-        <div class="footer">
-            <div class="timestamp">Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</div>
-        </div>
-    </div>
-</body>
-</html>"""
+        html_id = await store_html(html_content) if html_content else None
         
         # Create new messages
+        now = datetime.now()
         user_message = Message(
             id=str(uuid.uuid4()),
             role="user",
             content=request.message,
-            timestamp=datetime.now()
+            timestamp=now
         )
         
         assistant_message = Message(
             id=str(uuid.uuid4()),
             role="assistant",
             content=clean_text,
-            timestamp=datetime.now(),
+            timestamp=now,
             is_generated_ui=True  # Always UI
         )
         
         # Update conversation history
-        new_history = conversation_history + [user_message.dict(), assistant_message.dict()]
-        conversations[conversation_id] = new_history
+        new_history = conversation_history + MSG_LIST_ADAPTER.dump_python([user_message, assistant_message], mode="json")
+        await save_conversation(conversation_id, new_history)
         
         return ChatResponse(
             response=clean_text,
             conversation_id=conversation_id,
             is_ui=True,  # Always UI
             html_content=html_content,
-            history=[Message(**msg) for msg in new_history]
+            html_id=html_id,
+            history=MSG_LIST_ADAPTER.validate_python(new_history)
         )
         
     except Exception as e:
@@ -606,17 +902,16 @@ async def chat(request: ChatRequest):
 @app.get("/api/conversations/{conversation_id}")
 async def get_conversation(conversation_id: str):
     """Get conversation history by ID"""
-    if conversation_id not in conversations:
+    history = await load_conversation(conversation_id)
+    if history is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    history = conversations[conversation_id]
-    return {"conversation_id": conversation_id, "history": [Message(**msg) for msg in history]}
+    return {"conversation_id": conversation_id, "history": MSG_LIST_ADAPTER.validate_python(history)}
 
 @app.delete("/api/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: str):
     """Delete a conversation"""
-    if conversation_id in conversations:
-        del conversations[conversation_id]
+    await remove_conversation(conversation_id)
     return {"message": "Conversation deleted"}
 
 @app.get("/api/health")
@@ -629,35 +924,54 @@ async def health_check():
         "api_key_configured": GOOGLE_API_KEY is not None
     }
 
-# Store HTML content separately to avoid JSON issues
-html_storage = {}
+def accepts_brotli(accept_encoding):
+    """Check whether an Accept-Encoding header allows a Brotli-encoded response"""
+    qualities = {}
+    for coding in accept_encoding.split(","):
+        name, *params = coding.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    # An explicit "br" entry wins over the "*" wildcard
+    return qualities.get("br", qualities.get("*", 0.0)) > 0
 
 @app.get("/api/html/{html_id}", response_class=HTMLResponse)
-async def get_html_content(html_id: str):
+async def get_html_content(html_id: str, request: Request):
     """Get HTML content by ID for fast rendering"""
-    if html_id not in html_storage:
+    blob = await load_html_blob(html_id)
+    if blob is None:
         raise HTTPException(status_code=404, detail="HTML content not found")
     
-    response = HTMLResponse(content=html_storage[html_id])
+    # Serve the stored Brotli bytes as-is when the client accepts them
+    if accepts_brotli(request.headers.get("accept-encoding", "")):
+        response = Response(content=blob, media_type="text/html", headers={"Content-Encoding": "br"})
+    else:
+        response = HTMLResponse(content=brotli.decompress(blob))
+    response.headers["Vary"] = "Accept-Encoding"
     response.headers["Cache-Control"] = "no-cache"
-    response.headers["Access-Control-Allow-Origin"] = "*"
     return response
 
 @app.get("/api/html-raw/{html_id}")
 async def get_html_raw(html_id: str):
     """Get raw HTML content as JSON for iframe rendering"""
-    if html_id not in html_storage:
+    html_content = await load_html(html_id)
+    if html_content is None:
         raise HTTPException(status_code=404, detail="HTML content not found")
-    return {"html_content": html_storage[html_id]}
+    return {"html_content": html_content}
 
 @app.get("/api/render/{conversation_id}/{message_id}", response_class=HTMLResponse)
 async def render_html(conversation_id: str, message_id: str):
     """Render HTML content for a specific message"""
-    if conversation_id not in conversations:
+    conversation = await load_conversation(conversation_id)
+    if conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    conversation = conversations[conversation_id]
-    
     # Find the message with the HTML content
     for msg in conversation:
         if msg['id'] == message_id and msg.get('is_generated_ui'):
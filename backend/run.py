@@ -1,6 +1,7 @@
 """
 Run script for the Live UI Gemini FastAPI server
 """
+import os
 import uvicorn
 
 if __name__ == "__main__":
@@ -8,11 +9,23 @@ if __name__ == "__main__":
     print("📝 Make sure to set your GOOGLE_API_KEY environment variable")
     print("🌐 Server will be available at http://localhost:8000")
     print("📖 API docs will be available at http://localhost:8000/docs")
-    
+
+    is_dev = os.getenv("ENV") == "dev"
+
+    # Workers only share state through Redis, so default to a single worker without it
+    default_workers = (os.cpu_count() or 1) if os.getenv("REDIS_URL") else 1
+    workers = 1 if is_dev else int(os.getenv("WEB_CONCURRENCY", default_workers))
+    # Worker processes inherit this, so main.py can split GEMINI_MAX_CONCURRENT between them
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
-        log_level="info"
-    ) 
\ No newline at end of file
+        loop="uvloop",
+        http="httptools",
+        workers=workers,
+        reload=is_dev,
+        log_level="info",
+        access_log=is_dev
+    )
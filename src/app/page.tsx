@@ -17,6 +17,7 @@ interface ChatResponse {
   conversation_id: string
   is_ui: boolean
   html_content?: string
+  html_id?: string
   history: Message[]
 }
 
@@ -131,20 +132,62 @@ export default function Home() {
       
       setMessages(prev => [...prev, streamingMessage])
 
+      const decoder = new TextDecoder()
+      let buffer = ''
+      let eventName = ''
+      let htmlDeltaLines: string[] = []
+
       while (true) {
         const { done, value } = await reader.read()
         if (done) break
 
-        const chunk = new TextDecoder().decode(value)
-        const lines = chunk.split('\n')
+        // Keep any partial line for the next read so no event is dropped
+        buffer += decoder.decode(value, { stream: true })
+        const lines = buffer.split('\n')
+        buffer = lines.pop() || ''
+
+        for (const rawLine of lines) {
+          const line = rawLine.endsWith('\r') ? rawLine.slice(0, -1) : rawLine
+
+          if (line.startsWith('event:')) {
+            eventName = line.slice(6).trim()
+            continue
+          }
+
+          // HTML deltas arrive as a named event carrying raw HTML lines instead of JSON
+          if (eventName === 'html_delta') {
+            if (line.startsWith('data:')) {
+              const value = line.slice(5)
+              htmlDeltaLines.push(value.startsWith(' ') ? value.slice(1) : value)
+            } else if (line === '') {
+              currentHtml += htmlDeltaLines.join('\n')
+              eventName = ''
+              htmlDeltaLines = []
+              setGeneratedHtml(currentHtml)
+              setShowPreview(true)
+              
+              // Update iframes in real-time
+              setTimeout(() => {
+                updateIframeContent(iframeRef.current, currentHtml)
+                updateIframeContent(fullScreenIframeRef.current, currentHtml)
+              }, 50)
+              
+              // Mark message as UI generation
+              setMessages(prev => prev.map(msg => 
+                msg.id === streamingMessageId 
+                  ? { ...msg, is_generated_ui: true }
+                  : msg
+              ))
+            }
+            continue
+          }
 
-        for (const line of lines) {
           if (line.startsWith('data: ')) {
             try {
               const data = JSON.parse(line.slice(6))
               
               if (data.type === 'text_chunk') {
-                accumulatedText = data.accumulated_text
+                accumulatedText += data.content
                 setStreamingText(accumulatedText)
                 finalConversationId = data.conversation_id
                 
@@ -156,38 +199,24 @@ export default function Home() {
                 ))
               }
               
-              else if (data.type === 'html_chunk' || data.type === 'html_complete') {
-                currentHtml = data.html_content
-                setGeneratedHtml(currentHtml)
-                setShowPreview(true)
-                
-                // Update iframes in real-time
-                setTimeout(() => {
-                  updateIframeContent(iframeRef.current, currentHtml)
-                  updateIframeContent(fullScreenIframeRef.current, currentHtml)
-                }, 50)
-                
-                // Mark message as UI generation
-                setMessages(prev => prev.map(msg => 
-                  msg.id === streamingMessageId 
-                    ? { ...msg, is_generated_ui: true }
-                    : msg
-                ))
-              }
-              
               else if (data.type === 'complete') {
                 // Final update
                 setConversationId(data.conversation_id)
                 setStreamingText('')
                 
-                if (data.html_content) {
-                  setGeneratedHtml(data.html_content)
-                  setShowPreview(true)
-                  
-                  setTimeout(() => {
-                    updateIframeContent(iframeRef.current, data.html_content)
-                    updateIframeContent(fullScreenIframeRef.current, data.html_content)
-                  }, 100)
+                if (data.html_id) {
+                  // The final HTML is stored server-side; fetch it once by ID
+                  const htmlResponse = await fetch(getApiUrl(`/api/html-raw/${data.html_id}`))
+                  if (htmlResponse.ok) {
+                    const { html_content: finalHtml } = await htmlResponse.json()
+                    setGeneratedHtml(finalHtml)
+                    setShowPreview(true)
+                    
+                    setTimeout(() => {
+                      updateIframeContent(iframeRef.current, finalHtml)
+                      updateIframeContent(fullScreenIframeRef.current, finalHtml)
+                    }, 100)
+                  }
                 }
                 
                 // Update final message
@@ -72,7 +72,8 @@ trap cleanup SIGINT SIGTERM
 echo "🐍 Starting Python FastAPI backend on port 8000..."
 cd backend
 source ../venv/bin/activate
-python run.py &
+# Local development: auto-reload, access log and a single worker
+ENV=dev python run.py &
 BACKEND_PID=$!
 cd ..
 